@@ -14,6 +14,7 @@ from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.http import MediaFileUpload
+from retention_manager import RetentionManager, GB
 
 
 class OBSRecordingAutomator:
@@ -24,6 +25,9 @@ class OBSRecordingAutomator:
         self.drive_services = {}
         self.recording_file = None
         self.current_group = None
+        self.active_record_folder = None
+        self.primary_record_folder = None
+        self.retention = RetentionManager(self.config["retention"])
 
     def load_config(self, config_file):
         default_config = {
@@ -33,6 +37,17 @@ class OBSRecordingAutomator:
                 "password": "",
                 "obs_executable": "obs64.exe"
             },
+            "retention": {
+                "ledger_file": "upload_ledger.json",
+                "min_free_gb": 5,
+                "expected_session_minutes": 180,
+                "default_session_gb": 10,
+                "safety_factor": 1.25,
+                "bitrate_history": 20,
+                "hold_poll_seconds": 60,
+                "check_interval_seconds": 60,
+                "overflow_folders": []
+            },
             "groups": {
                 "Group1": {
                     "scene_name": "Scene 1",
@@ -64,6 +79,9 @@ class OBSRecordingAutomator:
                     config["obs"] = default_config["obs"]
                 if "groups" not in config:
                     config["groups"] = default_config["groups"]
+                retention = dict(default_config["retention"])
+                retention.update(config.get("retention", {}))
+                config["retention"] = retention
         else:
             config = default_config
             with open(config_file, 'w') as f:
@@ -187,7 +205,43 @@ class OBSRecordingAutomator:
             print(f"Failed to set recording directory: {e}")
             return False
 
+    def get_obs_record_directory(self):
+        try:
+            response = self.obs_ws.call(requests.GetRecordDirectory())
+            return response.datain['recordDirectory']
+        except Exception as e:
+            print(f"Failed to get recording directory: {e}")
+            return None
+
+    def get_overflow_folders(self):
+        group_config = self.get_current_group_config()
+        return group_config.get(
+            "overflow_folders", self.config["retention"]["overflow_folders"])
+
+    def switch_recording_folder(self, folder):
+        if folder != self.get_recording_path():
+            print(f"↪️ Switching recording folder to: {folder}")
+            if not self.set_recording_folder(folder):
+                return False
+        self.active_record_folder = folder
+        return True
+
+    def ensure_recording_space(self):
+        group_config = self.get_current_group_config()
+        self.primary_record_folder = group_config.get(
+            "record_folder") or self.get_obs_record_directory()
+        if not self.primary_record_folder:
+            print("⚠️ Unknown recording directory, skipping disk space check")
+            return True
+        folder = self.retention.wait_for_recording_folder(
+            self.primary_record_folder, self.get_overflow_folders())
+        if not folder:
+            return False
+        return self.switch_recording_folder(folder)
+
     def start_recording(self):
+        if not self.ensure_recording_space():
+            return False
         try:
             self.obs_ws.call(requests.StartRecord())
             print("Recording started")
@@ -205,6 +259,8 @@ class OBSRecordingAutomator:
             return False
 
     def get_recording_path(self):
+        if self.active_record_folder:
+            return self.active_record_folder
         group_config = self.get_current_group_config()
         return group_config.get("record_folder")
 
@@ -283,7 +339,7 @@ class OBSRecordingAutomator:
             request = drive_service.files().create(
                 body=file_metadata,
                 media_body=media,
-                fields='id'
+                fields='id,size,md5Checksum'
             )
 
             response = None
@@ -317,6 +373,12 @@ class OBSRecordingAutomator:
 
             print_progress_bar(file_size, file_size)
             print(f"\n✅ Upload completed! File ID: {response.get('id')}")
+            try:
+                if self.retention.record_upload(file_path, group_name, response):
+                    print(
+                        "✅ Upload verified, file may be evicted when disk space is needed")
+            except Exception as e:
+                print(f"⚠️ Failed to record upload in ledger: {e}")
             return True
 
         except Exception as e:
@@ -388,16 +450,21 @@ class OBSRecordingAutomator:
         self.observer.start()
         print(f"Monitoring recording status for group: {self.current_group}")
         print("Press Ctrl+C to stop monitoring")
+        check_interval = self.config["retention"]["check_interval_seconds"]
         try:
             was_recording = False
+            recording_started_at = None
+            last_space_check = 0
             while True:
                 is_recording = self.get_recording_status()
                 if is_recording and not was_recording:
                     print(f"Recording started for {self.current_group}")
                     was_recording = True
+                    recording_started_at = time.time()
                 elif not is_recording and was_recording:
                     print(f"Recording stopped for {self.current_group}")
                     was_recording = False
+                    recording_duration = time.time() - recording_started_at
 
                     # 🔄 Wait for file to appear
                     print("⏳ Waiting for recording file to appear...")
@@ -430,6 +497,8 @@ class OBSRecordingAutomator:
                                     "❌ File not found. Try again or press Enter to skip.")
 
                     if self.recording_file and os.path.exists(self.recording_file):
+                        self.retention.record_session(
+                            self.recording_file, recording_duration)
                         print(
                             f"Uploading recorded file to {self.current_group}'s Drive: {self.recording_file}")
                         if self.upload_to_drive(self.recording_file, self.current_group):
@@ -439,6 +508,28 @@ class OBSRecordingAutomator:
                             print(f"❌ Upload failed for {self.current_group}!")
                         self.recording_file = None
 
+                    # 💾 Prepare space for the next session started from OBS
+                    if self.primary_record_folder and not self.get_recording_status():
+                        folder = self.retention.find_recording_folder(
+                            self.primary_record_folder, self.get_overflow_folders())
+                        if not folder:
+                            print(
+                                "⚠️ No volume has enough free space for the next session")
+                        elif folder != recording_path and self.switch_recording_folder(folder):
+                            self.observer.unschedule_all()
+                            self.observer.schedule(
+                                event_handler, folder, recursive=False)
+                            recording_path = folder
+
+                if is_recording and time.time() - last_space_check >= check_interval:
+                    last_space_check = time.time()
+                    try:
+                        if not self.retention.enforce_minimum(recording_path):
+                            print(
+                                f"⚠️ Low disk space in {recording_path}: {self.retention.free_bytes(recording_path) / GB:.2f} GB free")
+                    except OSError as e:
+                        print(f"⚠️ Failed to check disk space: {e}")
+
                 time.sleep(1)
         except KeyboardInterrupt:
             print("\nMonitoring stopped")
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+
+GB = 1024 * 1024 * 1024
+
+
+class RetentionManager:
+    def __init__(self, settings):
+        self.settings = settings
+        self.ledger_file = settings["ledger_file"]
+        self.ledger = self.load_ledger()
+
+    def load_ledger(self):
+        self.ledger_readable = True
+        if os.path.exists(self.ledger_file):
+            try:
+                with open(self.ledger_file, 'r') as f:
+                    ledger = json.load(f)
+                ledger.setdefault("uploads", [])
+                ledger.setdefault("sessions", [])
+                return ledger
+            except Exception as e:
+                # Keep the unreadable file untouched so earlier uploads are not lost
+                self.ledger_readable = False
+                print(f"Failed to read upload ledger {self.ledger_file}: {e}")
+        return {"uploads": [], "sessions": []}
+
+    def save_ledger(self):
+        if not self.ledger_readable:
+            print(
+                f"⚠️ Not saving upload ledger: {self.ledger_file} could not be read and needs fixing")
+            return False
+        temp_file = f"{self.ledger_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(self.ledger, f, indent=4)
+            os.replace(temp_file, self.ledger_file)
+            return True
+        except Exception as e:
+            print(f"Failed to save upload ledger {self.ledger_file}: {e}")
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return False
+
+    @staticmethod
+    def file_md5(file_path, block_size=8 * 1024 * 1024):
+        md5 = hashlib.md5()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                md5.update(block)
+        return md5.hexdigest()
+
+    def verify_upload(self, file_path, drive_file):
+        """Check that the Drive copy matches the local file before it may be evicted"""
+        local_size = os.path.getsize(file_path)
+        remote_size = drive_file.get("size")
+        if remote_size is None or int(remote_size) != local_size:
+            print(
+                f"⚠️ Drive size mismatch for {file_path}: local {local_size}, remote {remote_size}")
+            return False
+        remote_md5 = drive_file.get("md5Checksum")
+        if not remote_md5:
+            print(
+                f"⚠️ Drive returned no checksum for {file_path}, upload not verified")
+            return False
+        if remote_md5 != self.file_md5(file_path):
+            print(f"⚠️ Drive checksum mismatch for {file_path}")
+            return False
+        return True
+
+    def record_upload(self, file_path, group_name, drive_file):
+        verified = self.verify_upload(file_path, drive_file)
+        self.ledger = self.load_ledger()
+        self.ledger["uploads"].append({
+            "path": os.path.abspath(file_path),
+            "group": group_name,
+            "drive_file_id": drive_file.get("id"),
+            "size": os.path.getsize(file_path),
+            "mtime": os.path.getmtime(file_path),
+            "uploaded_at": time.time(),
+            "verified": verified,
+            "evicted": False
+        })
+        self.save_ledger()
+        return verified
+
+    def record_session(self, file_path, duration_seconds):
+        if duration_seconds <= 0:
+            return
+        try:
+            size = os.path.getsize(file_path)
+        except OSError as e:
+            print(f"Failed to record session size for {file_path}: {e}")
+            return
+        self.ledger = self.load_ledger()
+        self.ledger["sessions"].append({
+            "path": os.path.abspath(file_path),
+            "size": size,
+            "duration_seconds": duration_seconds
+        })
+        history = self.settings["bitrate_history"]
+        self.ledger["sessions"] = self.ledger["sessions"][-history:]
+        self.save_ledger()
+
+    def estimate_session_bytes(self):
+        sessions = self.ledger["sessions"][-self.settings["bitrate_history"]:]
+        total_size = sum(s["size"] for s in sessions)
+        total_seconds = sum(s["duration_seconds"] for s in sessions)
+        if total_seconds <= 0:
+            estimate = self.settings["default_session_gb"] * GB
+        else:
+            bytes_per_second = total_size / total_seconds
+            estimate = bytes_per_second * \
+                self.settings["expected_session_minutes"] * 60
+        return int(estimate * self.settings["safety_factor"])
+
+    def required_free_bytes(self):
+        return self.estimate_session_bytes() + int(self.settings["min_free_gb"] * GB)
+
+    @staticmethod
+    def free_bytes(folder):
+        return shutil.disk_usage(folder).free
+
+    @staticmethod
+    def same_volume(path, folder):
+        try:
+            return os.stat(path).st_dev == os.stat(folder).st_dev
+        except OSError:
+            return False
+
+    def eviction_candidates(self, folder):
+        candidates = []
+        for entry in self.ledger["uploads"]:
+            if not entry.get("verified") or entry.get("evicted"):
+                continue
+            path = entry["path"]
+            try:
+                if not os.path.exists(path) or not self.same_volume(path, folder):
+                    continue
+                # Never evict a file that changed after it was uploaded
+                if os.path.getsize(path) != entry["size"] or os.path.getmtime(path) != entry["mtime"]:
+                    continue
+            except OSError as e:
+                print(f"Skipping eviction candidate {path}: {e}")
+                continue
+            candidates.append(entry)
+        return sorted(candidates, key=lambda e: e["mtime"])
+
+    def reclaimable_bytes(self, folder):
+        return sum(entry["size"] for entry in self.eviction_candidates(folder))
+
+    def evict_until(self, folder, required_bytes):
+        self.ledger = self.load_ledger()
+        try:
+            free = self.free_bytes(folder)
+        except OSError as e:
+            print(f"Failed to check free space in {folder}: {e}")
+            return False
+        evicted = 0
+        for entry in self.eviction_candidates(folder):
+            if free >= required_bytes:
+                break
+            try:
+                os.remove(entry["path"])
+            except OSError as e:
+                print(f"Failed to evict {entry['path']}: {e}")
+                continue
+            entry["evicted"] = True
+            entry["evicted_at"] = time.time()
+            evicted += 1
+            print(
+                f"🧹 Evicted uploaded recording: {entry['path']} ({entry['size'] / GB:.2f} GB)")
+            try:
+                free = self.free_bytes(folder)
+            except OSError as e:
+                print(f"Failed to check free space in {folder}: {e}")
+                free = 0
+                break
+        if evicted:
+            self.save_ledger()
+        return free >= required_bytes
+
+    def enforce_minimum(self, folder):
+        """Evict verified uploads if the volume dropped below the hard free-space floor"""
+        return self.evict_until(folder, int(self.settings["min_free_gb"] * GB))
+
+    def find_recording_folder(self, record_folder, overflow_folders):
+        self.ledger = self.load_ledger()
+        required = self.required_free_bytes()
+        print(
+            f"💾 Next session needs about {required / GB:.2f} GB free (including reserve)")
+        for folder in [record_folder] + list(overflow_folders):
+            if not folder:
+                continue
+            try:
+                os.makedirs(folder, exist_ok=True)
+                free = self.free_bytes(folder)
+            except OSError as e:
+                print(f"Cannot use recording folder {folder}: {e}")
+                continue
+            # Only delete uploads on a volume that eviction can actually rescue
+            if free + self.reclaimable_bytes(folder) < required:
+                print(
+                    f"⚠️ Not enough space in {folder}: {free / GB:.2f} GB free")
+                continue
+            if self.evict_until(folder, required):
+                print(f"💾 Recording to {folder}")
+                return folder
+        return None
+
+    def wait_for_recording_folder(self, record_folder, overflow_folders):
+        """Hold back the recording until a volume has enough free space"""
+        poll_seconds = self.settings["hold_poll_seconds"]
+        try:
+            while True:
+                folder = self.find_recording_folder(
+                    record_folder, overflow_folders)
+                if folder:
+                    return folder
+                print(
+                    f"⏸️ Holding recording: no volume has enough free space. Retrying in {poll_seconds} seconds...")
+                time.sleep(poll_seconds)
+        except KeyboardInterrupt:
+            print("\nRecording cancelled while waiting for disk space.")
+            return None
@@ -0,0 +1,161 @@
+import os
+import json
+import hashlib
+
+import pytest
+
+from retention_manager import RetentionManager, GB
+
+
+def make_settings(tmp_path, **overrides):
+    settings = {
+        "ledger_file": str(tmp_path / "upload_ledger.json"),
+        "min_free_gb": 0,
+        "expected_session_minutes": 1,
+        "default_session_gb": 1,
+        "safety_factor": 1.0,
+        "bitrate_history": 20,
+        "hold_poll_seconds": 1,
+        "check_interval_seconds": 1,
+        "overflow_folders": []
+    }
+    settings.update(overrides)
+    return settings
+
+
+def write_recording(folder, name, size, mtime):
+    path = folder / name
+    path.write_bytes(b'x' * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def drive_file(path):
+    data = path.read_bytes()
+    return {"id": path.name, "size": str(len(data)), "md5Checksum": hashlib.md5(data).hexdigest()}
+
+
+@pytest.fixture
+def record_folder(tmp_path):
+    folder = tmp_path / "rec"
+    folder.mkdir()
+    return folder
+
+
+@pytest.fixture
+def fake_disk(monkeypatch):
+    """Simulate a volume whose free space is capacity minus the recordings on it"""
+    disk = {"capacity": 10000, "folders": {}}
+
+    def free_bytes(folder):
+        used = sum(os.path.getsize(os.path.join(folder, name))
+                   for name in os.listdir(folder))
+        return disk["folders"].get(folder, disk["capacity"]) - used
+
+    monkeypatch.setattr(RetentionManager, "free_bytes",
+                        staticmethod(free_bytes))
+    return disk
+
+
+def test_evicts_oldest_verified_uploads_first(tmp_path, record_folder, fake_disk):
+    manager = RetentionManager(make_settings(tmp_path))
+    for i, mtime in enumerate([300, 100, 200]):
+        path = write_recording(record_folder, f"{i}.mp4", 1000, mtime)
+        assert manager.record_upload(str(path), "g", drive_file(path))
+
+    assert manager.evict_until(str(record_folder), 8500)
+    assert sorted(os.listdir(record_folder)) == ["0.mp4"]
+    ledger = json.loads((tmp_path / "upload_ledger.json").read_text())
+    evicted = {os.path.basename(e["path"]): e["evicted"]
+               for e in ledger["uploads"]}
+    assert evicted == {"0.mp4": False, "1.mp4": True, "2.mp4": True}
+
+
+def test_skips_unverified_changed_and_other_volume_files(tmp_path, record_folder, monkeypatch):
+    manager = RetentionManager(make_settings(tmp_path))
+    unverified = write_recording(record_folder, "unverified.mp4", 100, 100)
+    bad_size = dict(drive_file(unverified), size="99")
+    assert not manager.record_upload(str(unverified), "g", bad_size)
+
+    changed = write_recording(record_folder, "changed.mp4", 100, 200)
+    assert manager.record_upload(str(changed), "g", drive_file(changed))
+    os.utime(changed, (250, 250))
+
+    elsewhere = write_recording(record_folder, "elsewhere.mp4", 100, 300)
+    assert manager.record_upload(str(elsewhere), "g", drive_file(elsewhere))
+
+    kept = write_recording(record_folder, "kept.mp4", 100, 400)
+    assert manager.record_upload(str(kept), "g", drive_file(kept))
+
+    real_same_volume = RetentionManager.same_volume
+    monkeypatch.setattr(RetentionManager, "same_volume", staticmethod(
+        lambda path, folder: not path.endswith("elsewhere.mp4") and real_same_volume(path, folder)))
+
+    candidates = manager.eviction_candidates(str(record_folder))
+    assert [os.path.basename(e["path"]) for e in candidates] == ["kept.mp4"]
+
+
+def test_missing_md5_is_not_verified(tmp_path, record_folder):
+    manager = RetentionManager(make_settings(tmp_path))
+    path = write_recording(record_folder, "a.mp4", 100, 100)
+    assert not manager.record_upload(str(path), "g", {"id": "1", "size": "100"})
+    assert manager.eviction_candidates(str(record_folder)) == []
+
+
+def test_estimate_session_bytes_without_history(tmp_path):
+    manager = RetentionManager(make_settings(
+        tmp_path, default_session_gb=2, safety_factor=1.5))
+    assert manager.estimate_session_bytes() == 3 * GB
+
+
+def test_estimate_session_bytes_from_bitrate_history(tmp_path, record_folder):
+    manager = RetentionManager(make_settings(
+        tmp_path, expected_session_minutes=2, safety_factor=2))
+    manager.record_session(
+        str(write_recording(record_folder, "a.mp4", 600, 100)), 10)
+    manager.record_session(
+        str(write_recording(record_folder, "b.mp4", 400, 200)), 10)
+    # 1000 bytes over 20 seconds -> 50 B/s * 120 s * 2
+    assert manager.estimate_session_bytes() == 12000
+
+
+def test_corrupt_ledger_is_not_overwritten(tmp_path, record_folder):
+    ledger_file = tmp_path / "upload_ledger.json"
+    ledger_file.write_text('{"uploads": [{"path": "a.mp4"')
+    manager = RetentionManager(make_settings(tmp_path))
+    path = write_recording(record_folder, "b.mp4", 100, 100)
+    manager.record_upload(str(path), "g", drive_file(path))
+    assert ledger_file.read_text() == '{"uploads": [{"path": "a.mp4"'
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_does_not_evict_on_volume_that_cannot_be_rescued(tmp_path, record_folder, fake_disk):
+    overflow = tmp_path / "overflow"
+    overflow.mkdir()
+    manager = RetentionManager(make_settings(tmp_path))
+    path = write_recording(record_folder, "a.mp4", 1000, 100)
+    assert manager.record_upload(str(path), "g", drive_file(path))
+
+    fake_disk["capacity"] = 0.5 * GB + 1000
+    assert manager.find_recording_folder(
+        str(record_folder), [str(overflow)]) is None
+    assert path.exists()
+
+    fake_disk["capacity"] = 2 * GB
+    assert manager.find_recording_folder(
+        str(record_folder), [str(overflow)]) == str(record_folder)
+    assert path.exists()
+
+
+def test_prefers_overflow_over_evicting_unrescuable_volume(tmp_path, record_folder, fake_disk):
+    overflow = tmp_path / "overflow"
+    overflow.mkdir()
+    manager = RetentionManager(make_settings(tmp_path))
+    path = write_recording(record_folder, "a.mp4", 1000, 100)
+    assert manager.record_upload(str(path), "g", drive_file(path))
+
+    fake_disk["capacity"] = 0.5 * GB
+    fake_disk["folders"][str(overflow)] = 2 * GB
+    assert manager.find_recording_folder(
+        str(record_folder), [str(overflow)]) == str(overflow)
+    assert path.exists()